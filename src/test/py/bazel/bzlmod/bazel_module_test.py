@@ -16,22 +16,28 @@
 
 import os
 import pathlib
+import shutil
 import tempfile
-import unittest
 
+from absl.testing import absltest
 from src.test.py.bazel import test_base
 from src.test.py.bazel.bzlmod.test_utils import BazelRegistry
+from src.test.py.bazel.bzlmod.test_utils import getBcrURL
 from src.test.py.bazel.bzlmod.test_utils import scratchFile
 
 
 class BazelModuleTest(test_base.TestBase):
 
-  def setUp(self):
-    test_base.TestBase.setUp(self)
-    self.registries_work_dir = tempfile.mkdtemp(dir=self._test_cwd)
-    self.main_registry = BazelRegistry(
-        os.path.join(self.registries_work_dir, 'main'))
-    self.main_registry.createCcModule('aaa', '1.0') \
+  @classmethod
+  def setUpClass(cls):
+    super(BazelModuleTest, cls).setUpClass()
+    # Building the main registry is the same for every test, so do it once and
+    # give each test its own copy to modify.
+    cls._registry_template_dir = tempfile.mkdtemp(
+        dir=test_base.TestBase.GetEnv('TEST_TMPDIR'))
+    cls._registry_template = BazelRegistry(
+        os.path.join(cls._registry_template_dir, 'main'))
+    cls._registry_template.createCcModule('aaa', '1.0') \
         .createCcModule('aaa', '1.1') \
         .createCcModule('bbb', '1.0', {'aaa': '1.0'}, {'aaa': 'com_foo_aaa'}) \
         .createCcModule('bbb', '1.1', {'aaa': '1.1'}) \
@@ -42,6 +48,17 @@ class BazelModuleTest(test_base.TestBase):
         .createCcModule('yanked2', '1.0') \
         .addMetadata('yanked1', yanked_versions={'1.0': 'dodgy'}) \
         .addMetadata('yanked2', yanked_versions={'1.0': 'sketchy'})
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls._registry_template_dir)
+    super(BazelModuleTest, cls).tearDownClass()
+
+  def setUp(self):
+    test_base.TestBase.setUp(self)
+    self.registries_work_dir = tempfile.mkdtemp(dir=self._test_cwd)
+    self.main_registry = self._registry_template.copy(
+        os.path.join(self.registries_work_dir, 'main'))
     self.writeBazelrcFile()
     self.ScratchFile('WORKSPACE')
     # The existence of WORKSPACE.bzlmod prevents WORKSPACE prefixes or suffixes
@@ -51,15 +68,29 @@ class BazelModuleTest(test_base.TestBase):
   def writeBazelrcFile(self, allow_yanked_versions=True):
     self.ScratchFile(
         '.bazelrc',
-        [
+        (
+            [
+                # Skip the server for CI runs that ask for it. This saves the
+                # server startup, but also loses the analysis cache between
+                # invocations, so it only helps tests running Bazel once.
+                'startup --batch',
+            ]
+            if os.environ.get('BAZEL_TEST_BATCH') == '1'
+            else []
+        )
+        + [
             # In ipv6 only network, this has to be enabled.
             # 'startup --host_jvm_args=-Djava.net.preferIPv6Addresses=true',
             'common --enable_bzlmod',
             'common --registry=' + self.main_registry.getURL(),
             # We need to have BCR here to make sure built-in modules like
             # bazel_tools can work.
-            'common --registry=https://bcr.bazel.build',
+            'common --registry=' + getBcrURL(),
             'common --verbose_failures',
+            # Share action outputs between tests, most of which compile the
+            # same aaa and bbb sources.
+            'common --disk_cache=%s' %
+            os.path.join(self._temp, 'disk_cache').replace('\\', '/'),
             # Set an explicit Java language version
             'common --java_language_version=8',
             'common --tool_java_language_version=8',
@@ -75,7 +106,45 @@ class BazelModuleTest(test_base.TestBase):
         ),
     )
 
-  def writeMainProjectFiles(self):
+  def writeModuleFile(self, deps, extra_lines=None):
+    """Writes a MODULE.bazel with a bazel_dep for each of the deps.
+
+    Args:
+      deps: The versions of the modules to depend on, keyed by module name.
+      extra_lines: Lines to add after the bazel_deps, e.g. an override.
+    """
+    self.ScratchFile('MODULE.bazel', [
+        'bazel_dep(name = "%s", version = "%s")' % dep for dep in deps.items()
+    ] + (extra_lines or []))
+
+  def writeMainCcFiles(self, deps, repo_names=None):
+    """Writes a //:main cc_binary calling hello_<dep> for each of the deps.
+
+    Args:
+      deps: The names of the modules that main depends on.
+      repo_names: The repository names to use for some of the deps, if they
+        are not visible under their module names.
+    """
+    if repo_names is None:
+      repo_names = {}
+    self.ScratchFile('BUILD', [
+        'cc_binary(',
+        '  name = "main",',
+        '  srcs = ["main.cc"],',
+        '  deps = [',
+    ] + [
+        '    "@%s//:lib_%s",' % (repo_names.get(dep, dep), dep) for dep in deps
+    ] + [
+        '  ],',
+        ')',
+    ])
+    self.ScratchFile('main.cc', ['#include "%s.h"' % dep for dep in deps] + [
+        'int main() {',
+    ] + ['    hello_%s("main function");' % dep for dep in deps] + [
+        '}',
+    ])
+
+  def writeMainProjectFiles(self, repo_names=None):
     self.ScratchFile('aaa.patch', [
         '--- a/aaa.cc',
         '+++ b/aaa.cc',
@@ -88,75 +157,25 @@ class BazelModuleTest(test_base.TestBase):
         '     printf("%s => %s\\n", caller.c_str(), lib_name.c_str());',
         ' }',
     ])
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = [',
-        '    "@aaa//:lib_aaa",',
-        '    "@bbb//:lib_bbb",',
-        '  ],',
-        ')',
-    ])
-    self.ScratchFile('main.cc', [
-        '#include "aaa.h"',
-        '#include "bbb.h"',
-        'int main() {',
-        '    hello_aaa("main function");',
-        '    hello_bbb("main function");',
-        '}',
-    ])
+    self.writeMainCcFiles(['aaa', 'bbb'], repo_names)
 
   def testSimple(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0")',
-    ])
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = ["@aaa//:lib_aaa"],',
-        ')',
-    ])
-    self.ScratchFile('main.cc', [
-        '#include "aaa.h"',
-        'int main() {',
-        '    hello_aaa("main function");',
-        '}',
-    ])
+    self.writeModuleFile({'aaa': '1.0'})
+    self.writeMainCcFiles(['aaa'])
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
     self.assertIn('main function => aaa@1.0', stdout)
 
   def testSimpleTransitive(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = ["@bbb//:lib_bbb"],',
-        ')',
-    ])
-    self.ScratchFile('main.cc', [
-        '#include "bbb.h"',
-        'int main() {',
-        '    hello_bbb("main function");',
-        '}',
-    ])
+    self.writeModuleFile({'bbb': '1.0'})
+    self.writeMainCcFiles(['bbb'])
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
     self.assertIn('main function => bbb@1.0', stdout)
     self.assertIn('bbb@1.0 => aaa@1.0', stdout)
 
   def testSimpleDiamond(self):
     self.writeMainProjectFiles()
-    self.ScratchFile(
-        'MODULE.bazel',
-        [
-            'bazel_dep(name = "aaa", version = "1.1")',
-            # bbb@1.0 has to depend on aaa@1.1 after MVS.
-            'bazel_dep(name = "bbb", version = "1.0")',
-        ])
+    # bbb@1.0 has to depend on aaa@1.1 after MVS.
+    self.writeModuleFile({'aaa': '1.1', 'bbb': '1.0'})
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
     self.assertIn('main function => aaa@1.1', stdout)
     self.assertIn('main function => bbb@1.0', stdout)
@@ -164,11 +183,9 @@ class BazelModuleTest(test_base.TestBase):
 
   def testSingleVersionOverrideWithPatch(self):
     self.writeMainProjectFiles()
-    self.ScratchFile(
-        'MODULE.bazel',
+    self.writeModuleFile(
+        {'aaa': '1.1', 'bbb': '1.1'},
         [
-            'bazel_dep(name = "aaa", version = "1.1")',
-            'bazel_dep(name = "bbb", version = "1.1")',
             # Both main and bbb@1.1 has to depend on the locally patched aaa@1.0
             'single_version_override(',
             '  module_name = "aaa",',
@@ -188,9 +205,7 @@ class BazelModuleTest(test_base.TestBase):
         os.path.join(self.registries_work_dir, 'another'),
         ' from another registry')
     another_registry.createCcModule('aaa', '1.0')
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0")',
-        'bazel_dep(name = "bbb", version = "1.0")',
+    self.writeModuleFile({'aaa': '1.0', 'bbb': '1.0'}, [
         'single_version_override(',
         '  module_name = "aaa",',
         '  registry = "%s",' % another_registry.getURL(),
@@ -204,9 +219,7 @@ class BazelModuleTest(test_base.TestBase):
   def testArchiveOverride(self):
     self.writeMainProjectFiles()
     archive_aaa_1_0 = self.main_registry.archives.joinpath('aaa.1.0.zip')
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.1")',
-        'bazel_dep(name = "bbb", version = "1.1")',
+    self.writeModuleFile({'aaa': '1.1', 'bbb': '1.1'}, [
         'archive_override(',
         '  module_name = "aaa",',
         '  urls = ["%s"],' % archive_aaa_1_0.as_uri(),
@@ -223,25 +236,24 @@ class BazelModuleTest(test_base.TestBase):
     self.writeMainProjectFiles()
 
     src_aaa_1_0 = self.main_registry.projects.joinpath('aaa', '1.0')
-    self.RunProgram(['git', 'init'], cwd=src_aaa_1_0, allow_failure=False)
-    self.RunProgram(['git', 'config', 'user.name', 'tester'],
-                    cwd=src_aaa_1_0,
-                    allow_failure=False)
-    self.RunProgram(['git', 'config', 'user.email', 'tester@foo.com'],
-                    cwd=src_aaa_1_0,
-                    allow_failure=False)
-    self.RunProgram(['git', 'add', './'], cwd=src_aaa_1_0, allow_failure=False)
-    self.RunProgram(['git', 'commit', '-m', 'Initial commit.'],
-                    cwd=src_aaa_1_0,
-                    allow_failure=False)
-    _, stdout, _ = self.RunProgram(['git', 'rev-parse', 'HEAD'],
-                                   cwd=src_aaa_1_0,
-                                   allow_failure=False)
-    commit = stdout[0].strip()
+    # Run all git commands in a single shell to avoid spawning one process per
+    # command; both sh and cmd.exe understand this syntax.
+    _, stdout, _ = self.RunProgram(
+        ' && '.join([
+            'git init',
+            'git config user.name tester',
+            'git config user.email tester@foo.com',
+            'git add ./',
+            'git commit -m "Initial commit."',
+            'git rev-parse HEAD',
+        ]),
+        shell=True,
+        cwd=src_aaa_1_0,
+        allow_failure=False)
+    # The output of `git rev-parse HEAD` comes last.
+    commit = stdout[-1].strip()
 
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.1")',
-        'bazel_dep(name = "bbb", version = "1.1")',
+    self.writeModuleFile({'aaa': '1.1', 'bbb': '1.1'}, [
         'git_override(',
         '  module_name = "aaa",',
         '  remote = "%s",' % src_aaa_1_0.as_uri(),
@@ -258,12 +270,10 @@ class BazelModuleTest(test_base.TestBase):
   def testLocalPathOverride(self):
     src_aaa_1_0 = self.main_registry.projects.joinpath('aaa', '1.0')
     self.writeMainProjectFiles()
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.1")',
-        'bazel_dep(name = "bbb", version = "1.1")',
+    self.writeModuleFile({'aaa': '1.1', 'bbb': '1.1'}, [
         'local_path_override(',
         '  module_name = "aaa",',
-        '  path = "%s",' % str(src_aaa_1_0.resolve()).replace('\\', '/'),
+        '  path = "%s",' % src_aaa_1_0.as_posix(),
         ')',
     ])
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
@@ -286,27 +296,13 @@ class BazelModuleTest(test_base.TestBase):
     ])
     self.main_registry.createCcModule(
         'aaa', '1.1-1', patches=[patch_file], patch_strip=1)
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.1-1")',
-    ])
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = ["@aaa//:lib_aaa"],',
-        ')',
-    ])
-    self.ScratchFile('main.cc', [
-        '#include "aaa.h"',
-        'int main() {',
-        '    hello_aaa("main function");',
-        '}',
-    ])
+    self.writeModuleFile({'aaa': '1.1-1'})
+    self.writeMainCcFiles(['aaa'])
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
     self.assertIn('main function => aaa@1.1-1 (remotely patched)', stdout)
 
   def testRepoNameForBazelDep(self):
-    self.writeMainProjectFiles()
+    self.writeMainProjectFiles(repo_names={'aaa': 'my_repo_a_name'})
     self.ScratchFile(
         'MODULE.bazel',
         [
@@ -314,16 +310,6 @@ class BazelModuleTest(test_base.TestBase):
             # bbb should still be able to access aaa as com_foo_aaa
             'bazel_dep(name = "bbb", version = "1.0")',
         ])
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = [',
-        '    "@my_repo_a_name//:lib_aaa",',
-        '    "@bbb//:lib_bbb",',
-        '  ],',
-        ')',
-    ])
     _, stdout, _ = self.RunBazel(['run', '//:main'], allow_failure=False)
     self.assertIn('main function => aaa@1.0', stdout)
     self.assertIn('main function => bbb@1.0', stdout)
@@ -331,11 +317,7 @@ class BazelModuleTest(test_base.TestBase):
 
   def testCheckDirectDependencies(self):
     self.writeMainProjectFiles()
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-        'bazel_dep(name = "ccc", version = "1.1")',
-    ])
+    self.writeModuleFile({'aaa': '1.0', 'bbb': '1.0', 'ccc': '1.1'})
     _, stdout, stderr = self.RunBazel(
         ['run', '//:main', '--check_direct_dependencies=warning'],
         allow_failure=False)
@@ -383,11 +365,8 @@ class BazelModuleTest(test_base.TestBase):
     self.assertIn(
         "ERROR: <builtin>: //pkg:_main~module_ext~foo: no such attribute 'invalid_attr' in 'repo_rule' rule",
         stderr)
-    self.assertTrue(
-        any([
-            '/pkg/extension.bzl", line 3, column 14, in _module_ext_impl'
-            in line for line in stderr
-        ]))
+    self.AssertAnyLineContains(
+        stderr, '/pkg/extension.bzl", line 3, column 14, in _module_ext_impl')
 
   def testCommandLineModuleOverride(self):
     self.ScratchFile('MODULE.bazel', [
@@ -427,7 +406,8 @@ class BazelModuleTest(test_base.TestBase):
 
   def testDownload(self):
     data_path = self.ScratchFile('data.txt', ['some data'])
-    data_url = pathlib.Path(data_path).resolve().as_uri()
+    # ScratchFile already returns an absolute path, no need to resolve it.
+    data_url = pathlib.Path(data_path).as_uri()
     self.ScratchFile('MODULE.bazel', [
         'data_ext = use_extension("//:ext.bzl", "data_ext")',
         'use_repo(data_ext, "no_op")',
@@ -456,7 +436,7 @@ class BazelModuleTest(test_base.TestBase):
     self.ScratchFile('MODULE.bazel', [
         'bazel_dep(name = "yanked1", version = "1.0")', 'local_path_override(',
         '  module_name = "yanked1",',
-        '  path = "%s",' % str(src_yanked1.resolve()).replace('\\', '/'), ')'
+        '  path = "%s",' % src_yanked1.as_posix(), ')'
     ])
     self.ScratchFile('WORKSPACE')
     self.ScratchFile('BUILD', [
@@ -484,11 +464,11 @@ class BazelModuleTest(test_base.TestBase):
     exit_code, _, stderr = self.RunBazel(['build', '--nobuild', '//:main'],
                                          allow_failure=True)
     self.AssertExitCode(exit_code, 48, stderr)
-    self.assertIn(
-        'Yanked version detected in your resolved dependency graph: ' +
-        'yanked1@1.0, for the reason: dodgy.', ''.join(stderr))
+    self.AssertAnyLineContains(
+        stderr, 'Yanked version detected in your resolved dependency graph: ' +
+        'yanked1@1.0, for the reason: dodgy.')
 
-  def testAllowedYankedDepsSuccessByFlag(self):
+  def testAllowedYankedDeps(self):
     self.writeBazelrcFile(allow_yanked_versions=False)
     self.ScratchFile('MODULE.bazel', [
         'bazel_dep(name = "ddd", version = "1.0")',
@@ -501,58 +481,37 @@ class BazelModuleTest(test_base.TestBase):
         '  deps = ["@ddd//:lib_ddd"],',
         ')',
     ])
-    self.RunBazel([
-        'build', '--nobuild', '--allow_yanked_versions=yanked1@1.0,yanked2@1.0',
-        '//:main'
-    ],
-                  allow_failure=False)
-
-  def testAllowedYankedDepsByEnvVar(self):
-    self.writeBazelrcFile(allow_yanked_versions=False)
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "ddd", version = "1.0")',
-    ])
-    self.ScratchFile('WORKSPACE')
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = ["@ddd//:lib_ddd"],',
-        ')',
-    ])
-    self.RunBazel(
-        ['build', '--nobuild', '//:main'],
-        env_add={'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked1@1.0,yanked2@1.0'},
-        allow_failure=False)
-
-    # Test changing the env var, the build should fail again.
-    exit_code, _, stderr = self.RunBazel(
-        ['build', '--nobuild', '//:main'],
-        env_add={'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked2@1.0'},
-        allow_failure=True)
-    self.AssertExitCode(exit_code, 48, stderr)
-    self.assertIn(
-        'Yanked version detected in your resolved dependency graph: ' +
-        'yanked1@1.0, for the reason: dodgy.', ''.join(stderr))
-
-  def testAllowedYankedDepsSuccessMix(self):
-    self.writeBazelrcFile(allow_yanked_versions=False)
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "ddd", version = "1.0")',
-    ])
-    self.ScratchFile('WORKSPACE')
-    self.ScratchFile('BUILD', [
-        'cc_binary(',
-        '  name = "main",',
-        '  srcs = ["main.cc"],',
-        '  deps = ["@ddd//:lib_ddd"],',
-        ')',
-    ])
-    self.RunBazel([
-        'build', '--nobuild', '--allow_yanked_versions=yanked1@1.0', '//:main'
-    ],
-                  env_add={'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked2@1.0'},
-                  allow_failure=False)
+    # The cases share one workspace, and with it one Bazel server, so they only
+    # differ in how the yanked versions are allowed.
+    for flags, env_add, allowed in [
+        # By flag.
+        (['--allow_yanked_versions=yanked1@1.0,yanked2@1.0'], None, True),
+        # By env var.
+        ([], {
+            'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked1@1.0,yanked2@1.0'
+        }, True),
+        # Test changing the env var, the build should fail again.
+        ([], {
+            'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked2@1.0'
+        }, False),
+        # By a mix of flag and env var.
+        (['--allow_yanked_versions=yanked1@1.0'], {
+            'BZLMOD_ALLOW_YANKED_VERSIONS': 'yanked2@1.0'
+        }, True),
+    ]:
+      with self.subTest(flags=flags, env_add=env_add):
+        exit_code, _, stderr = self.RunBazel(
+            ['build', '--nobuild'] + flags + ['//:main'],
+            env_add=env_add,
+            allow_failure=True)
+        if allowed:
+          self.AssertExitCode(exit_code, 0, stderr)
+        else:
+          self.AssertExitCode(exit_code, 48, stderr)
+          self.AssertAnyLineContains(
+              stderr,
+              'Yanked version detected in your resolved dependency graph: ' +
+              'yanked1@1.0, for the reason: dodgy.')
 
   def setUpProjectWithLocalRegistryModule(self, dep_name, dep_version):
     self.main_registry.generateCcSource(dep_name, dep_version)
@@ -632,28 +591,30 @@ class BazelModuleTest(test_base.TestBase):
         'load("@bare_rule//:defs.bzl", "bare_test")',
         'bare_test(name="me",data=["@foo"])',
     ])
-    self.main_registry.createLocalPathModule('foo', '1.0', 'foo', {
-        'quux': '1.0',
-        'bare_rule': '1.0'
-    })
-    self.main_registry.createLocalPathModule('bar', '2.0', 'bar', {
-        'quux': '2.0',
-        'bare_rule': '1.0'
-    })
-    self.main_registry.createLocalPathModule('quux', '1.0', 'quux1',
-                                             {'bare_rule': '1.0'})
-    self.main_registry.createLocalPathModule('quux', '2.0', 'quux2',
-                                             {'bare_rule': '1.0'})
-    for dir_name, build_file in [
-        ('foo', 'bare_test(name="foo",data=["@quux"])'),
-        ('bar', 'bare_test(name="bar",data=["@quux"])'),
-        ('quux1', 'bare_test(name="quux")'),
-        ('quux2', 'bare_test(name="quux")'),
+    # Each module is added to the registry and gets its project files in a
+    # single pass over this table.
+    for name, version, dir_name, deps, build_file in [
+        ('foo', '1.0', 'foo', {
+            'quux': '1.0',
+            'bare_rule': '1.0'
+        }, 'bare_test(name="foo",data=["@quux"])'),
+        ('bar', '2.0', 'bar', {
+            'quux': '2.0',
+            'bare_rule': '1.0'
+        }, 'bare_test(name="bar",data=["@quux"])'),
+        ('quux', '1.0', 'quux1', {
+            'bare_rule': '1.0'
+        }, 'bare_test(name="quux")'),
+        ('quux', '2.0', 'quux2', {
+            'bare_rule': '1.0'
+        }, 'bare_test(name="quux")'),
     ]:
-      projects_dir.joinpath(dir_name).mkdir(exist_ok=True)
-      scratchFile(projects_dir.joinpath(dir_name, 'WORKSPACE'))
+      self.main_registry.createLocalPathModule(name, version, dir_name, deps)
+      project_dir = projects_dir.joinpath(dir_name)
+      project_dir.mkdir(exist_ok=True)
+      scratchFile(project_dir.joinpath('WORKSPACE'))
       scratchFile(
-          projects_dir.joinpath(dir_name, 'BUILD'), [
+          project_dir.joinpath('BUILD'), [
               'load("@bare_rule//:defs.bzl", "bare_test")',
               'package(default_visibility=["//visibility:public"])',
               build_file,
@@ -932,14 +893,13 @@ source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
     _, _, stderr = self.RunBazel(
         ['build', '@bar//quux:book'], allow_failure=False
     )
-    stderr = '\n'.join(stderr)
-    self.assertIn('1st: @@bar~override//quux:bleb', stderr)
-    self.assertIn('2nd: @@bar~override//bleb:bleb', stderr)
-    self.assertIn('3rd: @@//bleb:bleb', stderr)
-    self.assertIn('4th: @@bar~override//bleb:bleb', stderr)
-    self.assertIn('5th: @@bleb//bleb:bleb', stderr)
-    self.assertIn('6th: @@//bleb:bleb', stderr)
+    self.AssertAnyLineContains(stderr, '1st: @@bar~override//quux:bleb')
+    self.AssertAnyLineContains(stderr, '2nd: @@bar~override//bleb:bleb')
+    self.AssertAnyLineContains(stderr, '3rd: @@//bleb:bleb')
+    self.AssertAnyLineContains(stderr, '4th: @@bar~override//bleb:bleb')
+    self.AssertAnyLineContains(stderr, '5th: @@bleb//bleb:bleb')
+    self.AssertAnyLineContains(stderr, '6th: @@//bleb:bleb')
 
 
 if __name__ == '__main__':
-  unittest.main()
+  absltest.main()
@@ -15,57 +15,83 @@
 """Tests bzlmod integration inside query (querying and external repo using the repo mapping)."""
 
 import os
+import pathlib
+import shutil
 import tempfile
-import unittest
 
+from absl.testing import absltest
 from src.test.py.bazel import test_base
 from src.test.py.bazel.bzlmod.test_utils import BazelRegistry
+from src.test.py.bazel.bzlmod.test_utils import getBcrURL
 
 
 class BzlmodQueryTest(test_base.TestBase):
   """Test class for bzlmod integration inside query (querying and external repo using the repo mapping)."""
 
-  def setUp(self):
-    test_base.TestBase.setUp(self)
-    self.registries_work_dir = tempfile.mkdtemp(dir=self._test_cwd)
-    self.main_registry = BazelRegistry(
-        os.path.join(self.registries_work_dir, 'main'))
-    self.main_registry.createCcModule('aaa', '1.0', {'ccc': '1.2'}) \
+  @classmethod
+  def setUpClass(cls):
+    super(BzlmodQueryTest, cls).setUpClass()
+    # No test modifies the registry, so all of them share one built here.
+    cls.registries_work_dir = tempfile.mkdtemp(
+        dir=test_base.TestBase.GetEnv('TEST_TMPDIR'))
+    cls.main_registry = BazelRegistry(
+        os.path.join(cls.registries_work_dir, 'main'))
+    cls.main_registry.createCcModule('aaa', '1.0', {'ccc': '1.2'}) \
       .createCcModule('aaa', '1.1') \
       .createCcModule('bbb', '1.0', {'aaa': '1.0'}, {'aaa': 'com_foo_bar_aaa'}) \
       .createCcModule('ccc', '1.2')
+    # The .bazelrc is the same for every test, so only build its lines once.
+    cls.bazelrc_lines = [
+        # In ipv6 only network, this has to be enabled.
+        # 'startup --host_jvm_args=-Djava.net.preferIPv6Addresses=true',
+        'common --experimental_enable_bzlmod',
+        'common --registry=' + cls.main_registry.getURL(),
+        # We need to have BCR here to make sure built-in modules like
+        # bazel_tools can work.
+        'common --registry=' + getBcrURL(),
+        # Disable yanked version check so we are not affected BCR changes.
+        'common --allow_yanked_versions=all',
+        # Share action outputs between tests. The repository cache is already
+        # shared, as it lives in the output user root that all tests get from
+        # TEST_TMPDIR.
+        'common --disk_cache=%s' % os.path.join(
+            test_base.TestBase.GetEnv('TEST_TMPDIR'),
+            'disk_cache').replace('\\', '/'),
+    ]
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.registries_work_dir)
+    super(BzlmodQueryTest, cls).tearDownClass()
 
-    self.ScratchFile(
-        '.bazelrc',
-        [
-            # In ipv6 only network, this has to be enabled.
-            # 'startup --host_jvm_args=-Djava.net.preferIPv6Addresses=true',
-            'common --experimental_enable_bzlmod',
-            'common --registry=' + self.main_registry.getURL(),
-            # We need to have BCR here to make sure built-in modules like
-            # bazel_tools can work.
-            'common --registry=https://bcr.bazel.build',
-            # Disable yanked version check so we are not affected BCR changes.
-            'common --allow_yanked_versions=all',
-        ])
+  def setUp(self):
+    test_base.TestBase.setUp(self)
+    self.ScratchFile('.bazelrc', self.bazelrc_lines)
     self.ScratchFile('WORKSPACE')
     # The existence of WORKSPACE.bzlmod prevents WORKSPACE prefixes or suffixes
     # from being used; this allows us to test built-in modules actually work
     self.ScratchFile('WORKSPACE.bzlmod')
 
+  def writeModuleFile(self, with_bbb=True, prefix_lines=None):
+    """Writes a MODULE.bazel depending on aaa as my_repo and optionally on bbb.
+
+    Args:
+      with_bbb: Whether to also depend on bbb.
+      prefix_lines: Lines to add before the bazel_deps, e.g. a module() call.
+    """
+    self.ScratchFile(
+        'MODULE.bazel', (prefix_lines or []) + [
+            'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
+        ] + (['bazel_dep(name = "bbb", version = "1.0")'] if with_bbb else []))
+
   def testQueryModuleRepoTargetsBelow(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile()
     _, stdout, _ = self.RunBazel(['query', '@my_repo//...'],
                                  allow_failure=False)
     self.assertListEqual(['@my_repo//:lib_aaa'], stdout)
 
   def testQueryModuleRepoTransitiveDeps(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-    ])
+    self.writeModuleFile(with_bbb=False)
     self.ScratchFile('BUILD', [
         'cc_binary(',
         '  name = "main",',
@@ -84,10 +110,7 @@ class BzlmodQueryTest(test_base.TestBase):
         ['//:main', '@my_repo//:lib_aaa', '@@ccc~1.2//:lib_ccc'], stdout)
 
   def testAqueryModuleRepoTargetsBelow(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile()
     _, stdout, _ = self.RunBazel(['aquery', '@my_repo//...'],
                                  allow_failure=False)
     # This label is stringified into a "purpose" in some action before it
@@ -96,9 +119,7 @@ class BzlmodQueryTest(test_base.TestBase):
     self.assertIn('Target: @my_repo//:lib_aaa', stdout)
 
   def testAqueryModuleRepoTransitiveDeps(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-    ])
+    self.writeModuleFile(with_bbb=False)
     self.ScratchFile('BUILD', [
         'cc_binary(',
         '  name = "main",',
@@ -118,18 +139,13 @@ class BzlmodQueryTest(test_base.TestBase):
     self.assertIn('Target: @@ccc~1.2//:lib_ccc', stdout)
 
   def testCqueryModuleRepoTargetsBelow(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile()
     _, stdout, _ = self.RunBazel(['cquery', '@my_repo//...'],
                                  allow_failure=False)
     self.assertRegex(stdout[0], r'@my_repo//:lib_aaa \([\w\d]+\)')
 
   def testCqueryModuleRepoTransitiveDeps(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-    ])
+    self.writeModuleFile(with_bbb=False)
     self.ScratchFile('BUILD', [
         'cc_binary(',
         '  name = "main",',
@@ -150,17 +166,11 @@ class BzlmodQueryTest(test_base.TestBase):
     self.assertEqual(len(stdout), 3)
 
   def testFetchModuleRepoTargetsBelow(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile()
     self.RunBazel(['fetch', '@my_repo//...'], allow_failure=False)
 
   def testGenQueryTargetLiteralInGenRule(self):
-    self.ScratchFile('MODULE.bazel', [
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile()
     self.ScratchFile('BUILD', [
         "genquery(name='rinne',", "scope= ['@my_repo//:lib_aaa'],",
         "expression = '@my_repo//:lib_aaa' )", "genrule(name='gen_rinne',",
@@ -168,18 +178,13 @@ class BzlmodQueryTest(test_base.TestBase):
         "cmd = 'cat $(SRCS) > $@')"
     ])
     self.RunBazel(['build', '//:gen_rinne'], allow_failure=False)
-    output_file = open('bazel-bin/gen_rinne.txt', 'r')
-    self.assertIsNotNone(output_file)
-    output = output_file.readlines()
-    output_file.close()
+    output = pathlib.Path('bazel-bin/gen_rinne.txt').read_text().splitlines(
+        keepends=True)
     self.assertListEqual(['@my_repo//:lib_aaa\n'], output)
 
   def testQueryCannotResolveRepoMapping_malformedModuleFile(self):
-    self.ScratchFile('MODULE.bazel', [
-        'module(namex="my_module", version = "1.0")',
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile(
+        prefix_lines=['module(namex="my_module", version = "1.0")'])
     exit_code, _, stderr = self.RunBazel(['query', '@my_repo//...'],
                                          allow_failure=True)
     self.AssertExitCode(exit_code, 48, stderr)
@@ -188,11 +193,8 @@ class BzlmodQueryTest(test_base.TestBase):
         stderr)
 
   def testFetchCannotResolveRepoMapping_malformedModuleFile(self):
-    self.ScratchFile('MODULE.bazel', [
-        'module(namex="my_module", version = "1.0")',
-        'bazel_dep(name = "aaa", version = "1.0", repo_name = "my_repo")',
-        'bazel_dep(name = "bbb", version = "1.0")',
-    ])
+    self.writeModuleFile(
+        prefix_lines=['module(namex="my_module", version = "1.0")'])
     exit_code, _, stderr = self.RunBazel(['fetch', '@my_repo//...'],
                                          allow_failure=True)
     self.AssertExitCode(exit_code, 48, stderr)
@@ -202,4 +204,4 @@ class BzlmodQueryTest(test_base.TestBase):
 
 
 if __name__ == '__main__':
-  unittest.main()
+  absltest.main()
@@ -24,6 +24,9 @@ import shutil
 import urllib.request
 import zipfile
 
+# A fixed timestamp for archive entries, so that archives are deterministic.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
 
 def download(url):
   """Download a file and return its content in bytes."""
@@ -43,13 +46,25 @@ def integrity(data):
   return 'sha256-' + base64.b64encode(hash_value.digest()).decode()
 
 
+def getBcrURL():
+  """Return the URL of the Bazel Central Registry to use in tests.
+
+  If the BCR_MIRROR environment variable points to a local checkout of
+  https://github.com/bazelbuild/bazel-central-registry, that checkout is used
+  so that registry lookups become local file reads instead of network
+  roundtrips.
+  """
+  mirror = os.environ.get('BCR_MIRROR')
+  if mirror:
+    return pathlib.Path(mirror).resolve().as_uri()
+  return 'https://bcr.bazel.build'
+
+
 def scratchFile(path, lines=None):
   """Creates a file at the given path with the given content."""
   with open(str(path), 'w') as f:
     if lines:
-      for l in lines:
-        f.write(l)
-        f.write('\n')
+      f.write('\n'.join(lines) + '\n')
 
 
 class Module:
@@ -59,14 +74,16 @@ class Module:
     self.name = name
     self.version = version
     self.archive_url = None
+    self.archive_integrity = None
     self.strip_prefix = ''
     self.module_dot_bazel = None
     self.patches = []
     self.patch_strip = 0
 
-  def set_source(self, archive_url, strip_prefix=None):
+  def set_source(self, archive_url, strip_prefix=None, archive_integrity=None):
     self.archive_url = archive_url
     self.strip_prefix = strip_prefix
+    self.archive_integrity = archive_integrity
     return self
 
   def set_module_dot_bazel(self, module_dot_bazel):
@@ -83,13 +100,24 @@ class BazelRegistry:
   """A class to help create a Bazel module project from scatch and add it into the registry."""
 
   def __init__(self, root, registry_suffix=''):
-    self.root = pathlib.Path(root)
+    # Resolve the root once, so that paths derived from it can be used in URLs
+    # and MODULE.bazel files without being resolved again.
+    self.root = pathlib.Path(root).resolve()
     self.projects = self.root.joinpath('projects')
     self.projects.mkdir(parents=True, exist_ok=True)
     self.archives = self.root.joinpath('archives')
     self.archives.mkdir(parents=True, exist_ok=True)
     self.registry_suffix = registry_suffix
 
+  def copy(self, root):
+    """Copy this registry to the given root and return the copied registry.
+
+    The archive URLs in the copy still point to the archives of this registry,
+    so this registry must outlive the copy.
+    """
+    shutil.copytree(str(self.root), str(root))
+    return BazelRegistry(root, self.registry_suffix)
+
   def setModuleBasePath(self, module_base_path):
     bazel_registry = {
         'module_base_path': module_base_path,
@@ -99,7 +127,7 @@ class BazelRegistry:
 
   def getURL(self):
     """Return the URL of this registry."""
-    return self.root.resolve().as_uri()
+    return self.root.as_uri()
 
   def generateCcSource(self, name, version, deps=None, repo_names=None):
     """Generate a cc project with given dependency information.
@@ -187,14 +215,22 @@ class BazelRegistry:
     return src_dir
 
   def createArchive(self, name, version, src_dir):
-    """Create an archive with a given source directory."""
+    """Create an archive with a given source directory.
+
+    Entries are added in a sorted order with a fixed timestamp, so archives of
+    identical sources get the same integrity and can be served from the
+    repository cache shared by all tests.
+    """
     zip_path = self.archives.joinpath('%s.%s.zip' % (name, version))
     zip_obj = zipfile.ZipFile(str(zip_path), 'w')
-    for foldername, _, filenames in os.walk(str(src_dir)):
-      for filename in filenames:
+    for foldername, dirnames, filenames in os.walk(str(src_dir)):
+      dirnames.sort()
+      for filename in sorted(filenames):
         filepath = os.path.join(foldername, filename)
-        zip_obj.write(filepath,
-                      str(pathlib.Path(filepath).relative_to(src_dir)))
+        info = zipfile.ZipInfo.from_file(
+            filepath, str(pathlib.Path(filepath).relative_to(src_dir)))
+        info.date_time = ZIP_DATE_TIME
+        zip_obj.writestr(info, read(filepath))
     zip_obj.close()
     return zip_path
 
@@ -210,7 +246,8 @@ class BazelRegistry:
     # Create source.json & copy patch files to the registry
     source = {
         'url': module.archive_url,
-        'integrity': integrity(download(module.archive_url)),
+        'integrity': (module.archive_integrity or
+                      integrity(download(module.archive_url))),
     }
     if module.strip_prefix:
       source['strip_prefix'] = module.strip_prefix
@@ -239,7 +276,8 @@ class BazelRegistry:
     src_dir = self.generateCcSource(name, version, deps, repo_names)
     archive = self.createArchive(name, version, src_dir)
     module = Module(name, version)
-    module.set_source(archive.resolve().as_uri())
+    module.set_source(
+        archive.as_uri(), archive_integrity=integrity(read(archive)))
     module.set_module_dot_bazel(src_dir.joinpath('MODULE.bazel'))
     if patches:
       module.set_patches(patches, patch_strip)
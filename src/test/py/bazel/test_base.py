@@ -170,6 +170,20 @@ class TestBase(unittest.TestCase):
       if entry in f.read():
         self.fail('File "%s" does contain "%s"' % (file_path, entry))
 
+  def AssertAnyLineContains(self, lines, entry):
+    """Assert that at least one of `lines` contains `entry`.
+
+    Unlike joining the lines and searching the result, this stops at the first
+    match and doesn't build a copy of the whole output.
+
+    Args:
+      lines: [string]; the lines to search, e.g. the stderr lines of RunBazel
+      entry: string; the text to look for
+    """
+    if not any(entry in l for l in lines):
+      self.fail('"%s" not found in any line of:\n%s' %
+                (entry, '\n'.join(lines)))
+
   def CreateWorkspaceWithDefaultRepos(self, path, lines=None):
     rule_definition = [
         'load("@bazel_tools//tools/build_defs/repo:http.bzl", "http_archive")'
@@ -293,9 +307,7 @@ class TestBase(unittest.TestCase):
     self.ScratchDir(os.path.dirname(path))
     with open(abspath, 'w') as f:
       if lines:
-        for l in lines:
-          f.write(l)
-          f.write('\n')
+        f.write('\n'.join(lines) + '\n')
     if executable:
       os.chmod(abspath, stat.S_IRWXU)
     return abspath
@@ -22,6 +22,10 @@ PORTABLE_MTIME = 946684800  # 2000-01-01 00:00:00.000 UTC
 
 DEFAULT_MTIME = 0  # The posix beginning of time
 
+# Buffer the output file, so that the many small header and padding blocks
+# tarfile writes per member reach the disk in large writes.
+OUTPUT_BUFSIZE = 1024 * 1024
+
 
 class TarFileWriter(object):
   """A wrapper to write tar files."""
@@ -43,10 +47,12 @@ class TarFileWriter(object):
     mode = 'w:'
     self.name = name
     self.root_directory = root_directory.rstrip('/')
+    # Names starting with one of these prefixes are already rooted.
+    self.rooted_prefixes = ('/', self.root_directory + '/')
 
     self.preserve_mtime = preserve_tar_mtimes
 
-    self.fileobj = None
+    self.fileobj = open(name, 'wb', buffering=OUTPUT_BUFSIZE)
     self.tar = tarfile.open(name=name, mode=mode, fileobj=self.fileobj)
     self.members = set([])
     self.directories = set([])
@@ -85,8 +91,8 @@ class TarFileWriter(object):
       TarFileWriter.Error: when the recursion depth has exceeded the
                            `depth` argument.
     """
-    if not (name == self.root_directory or name.startswith('/')
-            or name.startswith(self.root_directory + '/')):
+    if not (name == self.root_directory or
+            name.startswith(self.rooted_prefixes)):
       name = os.path.join(self.root_directory, name)
     if mtime is None:
       mtime = DEFAULT_MTIME
@@ -170,8 +176,8 @@ class TarFileWriter(object):
       # Recurse into directory
       self.add_dir(name, file_content, uid, gid, uname, gname, mtime, mode)
       return
-    if not (name == self.root_directory or name.startswith('/') or
-            name.startswith(self.root_directory + '/')):
+    if not (name == self.root_directory or
+            name.startswith(self.rooted_prefixes)):
       name = os.path.join(self.root_directory, name)
     if kind == tarfile.DIRTYPE:
       name = name.rstrip('/')
@@ -222,6 +228,6 @@ class TarFileWriter(object):
       TarFileWriter.Error: if an error happens when compressing the output file.
     """
     self.tar.close()
-    # Close the gzip file object if necessary.
+    # tarfile does not close a file object it was given, so close it here.
     if self.fileobj:
       self.fileobj.close()
@@ -15,6 +15,7 @@
 
 import argparse
 import os
+import stat
 import sys
 
 # Do not edit this line. Copybara replaces it with PY2 migration helper.
@@ -32,6 +33,12 @@ class TarFile(object):
     self.directory = directory
     self.output = output
     self.root_directory = root_directory
+    # Prefix of every destination in the layer, computed once rather than for
+    # each added file.
+    if directory and directory != '/':
+      self.dest_prefix = directory.lstrip('/') + '/'
+    else:
+      self.dest_prefix = ''
 
   def __enter__(self):
     self.tarfile = archive.TarFileWriter(self.output, self.root_directory)
@@ -40,6 +47,13 @@ class TarFile(object):
   def __exit__(self, t, v, traceback):
     self.tarfile.close()
 
+  def destination(self, destfile):
+    """Returns the normalized path of destfile in the layer."""
+    dest = self.dest_prefix + destfile.lstrip('/')  # Remove leading slashes
+    if _needs_normpath(dest):
+      dest = os.path.normpath(dest)
+    return dest
+
   def add_file(self, f, destfile):
     """Add a file to the tar file.
 
@@ -47,14 +61,46 @@ class TarFile(object):
        f: the file to add to the layer
        destfile: the name of the file in the layer
     """
-    dest = destfile.lstrip('/')  # Remove leading slashes
-    if self.directory and self.directory != '/':
-      dest = self.directory.lstrip('/') + '/' + dest
-    mode = 0o755 if os.access(f, os.X_OK) else 0o644
-    dest = os.path.normpath(dest)
+    self.add_resolved_file(f, self.destination(destfile), os.stat(f))
+
+  def add_resolved_file(self, f, dest, st):
+    """Add a file whose destination and stat result are already known.
+
+    Args:
+       f: the file to add to the layer
+       dest: the normalized name of the file in the layer, see destination
+       st: the os.stat result of f
+    """
+    mode = 0o755 if _is_executable(f, st) else 0o644
     self.tarfile.add_file(dest, file_content=f, mode=mode)
 
 
+def _is_executable(f, st):
+  """Returns whether f, whose os.stat result is st, is packaged executable."""
+  if os.name == 'nt':
+    # st_mode only has executable bits for .exe, .bat, .cmd and .com files
+    # on Windows, while os.access reports every existing file as executable.
+    return os.access(f, os.X_OK)
+  # The stat already has the executable bits; os.access would also check
+  # them against the real uid and gid.
+  return st.st_mode & 0o111
+
+
+def _needs_normpath(path):
+  """Returns whether os.path.normpath may change the given relative path.
+
+  Destinations are usually already normalized, so this cheap check lets
+  add_file skip normpath for most of them.
+  """
+  if os.sep != '/':
+    return True
+  if path in ('', '.', '..'):
+    return True
+  if path.startswith(('./', '../')) or path.endswith(('/', '/.', '/..')):
+    return True
+  return '//' in path or '/./' in path or '/../' in path
+
+
 def unquote_and_split(arg, c):
   """Split a string at the first unquoted occurrence of a character.
 
@@ -71,23 +117,28 @@ def unquote_and_split(arg, c):
     The unquoted string before the separator and the string after the
     separator.
   """
-  head = ''
+  # Jump from one backslash to the next with str.find rather than looking at
+  # every character, and only join the unquoted pieces once at the end.
+  head = []
   i = 0
-  while i < len(arg):
-    if arg[i] == c:
-      return (head, arg[i + 1:])
-    elif arg[i] == '\\':
-      i += 1
-      if i == len(arg):
-        # dangling quotation symbol
-        return (head, '')
-      else:
-        head += arg[i]
-    else:
-      head += arg[i]
-    i += 1
-  # if we leave the loop, the character c was not found unquoted
-  return (head, '')
+  n = len(arg)
+  while i < n:
+    j = arg.find(c, i)
+    k = arg.find('\\', i, j if j != -1 else n)
+    if k == -1:
+      if j == -1:
+        # the character c was not found unquoted
+        head.append(arg[i:])
+        return (''.join(head), '')
+      head.append(arg[i:j])
+      return (''.join(head), arg[j + 1:])
+    head.append(arg[i:k])
+    if k + 1 == n:
+      # dangling quotation symbol
+      return (''.join(head), '')
+    head.append(arg[k + 1])
+    i = k + 2
+  return (''.join(head), '')
 
 
 def main():
@@ -112,10 +163,31 @@ def main():
   opts = parser.parse_args()
 
   # Add objects to the tar file
+  files = [unquote_and_split(f, '=') for f in opts.file]
   with TarFile(opts.output, opts.directory, opts.root_directory) as output:
-    for f in opts.file:
-      (inf, tof) = unquote_and_split(f, '=')
-      output.add_file(inf, tof)
+    # Bind the per-file lookups to locals, this is the hot loop for large
+    # layers. Each file is stat'ed and gets its destination computed once.
+    seen = set()
+    add_seen = seen.add
+    destination = output.destination
+    entries = []
+    for entry in files:
+      if entry in seen:
+        print('Duplicate file entry: %s=%s, skipping' % entry)
+        continue
+      add_seen(entry)
+      (inf, tof) = entry
+      entries.append((destination(tof), len(entries), inf, os.stat(inf)))
+    # Sort the files by their destination in the layer, so that entries of the
+    # same directory end up next to each other. Ties keep their command line
+    # order, so the first file given for a destination still wins. A directory
+    # source adds entries below its destination that may collide with other
+    # files, so the command line order is kept as is when there is one.
+    if not any(stat.S_ISDIR(st.st_mode) for (_, _, _, st) in entries):
+      entries.sort()
+    add = output.add_resolved_file
+    for (dest, _, inf, st) in entries:
+      add(inf, dest, st)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+# Copyright 2023 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing for build_tar."""
+
+import itertools
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from tools.build_defs.pkg import build_tar
+
+
+class UnquoteAndSplitTest(unittest.TestCase):
+  """Testing for unquote_and_split."""
+
+  def testSplit(self):
+    self.assertEqual(("a", "b"), build_tar.unquote_and_split("a=b", "="))
+    self.assertEqual(("a", "b=c"), build_tar.unquote_and_split("a=b=c", "="))
+    self.assertEqual(("", "b"), build_tar.unquote_and_split("=b", "="))
+    self.assertEqual(("", ""), build_tar.unquote_and_split("", "="))
+
+  def testNoSeparator(self):
+    self.assertEqual(("abc", ""), build_tar.unquote_and_split("abc", "="))
+
+  def testEscapedSeparator(self):
+    self.assertEqual(("a=b", "c"), build_tar.unquote_and_split("a\\=b=c", "="))
+    self.assertEqual(("a=b", ""), build_tar.unquote_and_split("a\\=b", "="))
+
+  def testEscapedBackslash(self):
+    self.assertEqual(("a\\", "b"), build_tar.unquote_and_split("a\\\\=b", "="))
+
+  def testEscapedCharacter(self):
+    self.assertEqual(("abc", "d"), build_tar.unquote_and_split("a\\bc=d", "="))
+
+  def testDanglingBackslash(self):
+    self.assertEqual(("abc", ""), build_tar.unquote_and_split("abc\\", "="))
+
+  def testBackslashAfterSeparator(self):
+    self.assertEqual(("a", "b\\c"), build_tar.unquote_and_split("a=b\\c", "="))
+    self.assertEqual(("a", "b\\=c"),
+                     build_tar.unquote_and_split("a=b\\=c", "="))
+
+
+class NeedsNormpathTest(unittest.TestCase):
+  """Testing for _needs_normpath."""
+
+  def testNeedsNormpath(self):
+    for path in ["", ".", "..", "a/", "a//b", "./a", "../a", "a/.", "a/..",
+                 "a/./b", "a/../b"]:
+      self.assertTrue(build_tar._needs_normpath(path), path)
+
+  @unittest.skipIf(os.sep != "/", "normpath is always used on this platform")
+  def testAlreadyNormalized(self):
+    for path in ["a", "a/b/c", ".a/a./..a/a..", "a.b/.c"]:
+      self.assertFalse(build_tar._needs_normpath(path), path)
+
+  def testNeverSkipsNeededNormpath(self):
+    # Every relative path of up to 6 components from these pieces.
+    for n in range(7):
+      for pieces in itertools.product(["a", ".", "..", "/"], repeat=n):
+        path = "".join(pieces)
+        if path.startswith("/"):
+          continue
+        if not build_tar._needs_normpath(path):
+          self.assertEqual(path, os.path.normpath(path))
+
+
+class BuildTarTest(unittest.TestCase):
+  """Testing for the build_tar main function."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp(dir=os.environ["TEST_TMPDIR"])
+    self.output = os.path.join(self.tempdir, "out.tar")
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+  def writeFile(self, path, content):
+    path = os.path.join(self.tempdir, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(content)
+
+  def buildTar(self, *files):
+    """Runs build_tar with the given src=dest files, src relative to tempdir."""
+    args = ["build_tar", "--output", self.output]
+    for f in files:
+      src, dest = f.split("=", 1)
+      # Quote the source like pkg.bzl does, so that backslashes in Windows
+      # paths are not taken as escape characters.
+      src = os.path.join(self.tempdir, src).replace("\\", "\\\\")
+      args += ["--file", "%s=%s" % (src, dest)]
+    with mock.patch.object(sys, "argv", args):
+      build_tar.main()
+
+  def assertTarFileData(self, expected):
+    """Asserts the name and data of the regular files in the output."""
+    with tarfile.open(self.output, "r:") as f:
+      actual = [(m.name, f.extractfile(m).read().decode())
+                for m in f.getmembers() if m.isfile()]
+    self.assertEqual(expected, actual)
+
+  def testSortedByDestination(self):
+    self.writeFile("a", "a")
+    self.writeFile("b", "b")
+    self.buildTar("b=/usr/b", "a=etc/a")
+    self.assertTarFileData([("./etc/a", "a"), ("./usr/b", "b")])
+
+  def testFirstWinsForSameNormalizedDestination(self):
+    self.writeFile("f1", "f1")
+    self.writeFile("f2", "f2")
+    self.buildTar("f1=x/../a", "f2=a")
+    self.assertTarFileData([("./a", "f1")])
+
+  def testFirstWinsAgainstDirectoryContent(self):
+    self.writeFile("other", "other")
+    self.writeFile("d/b", "b")
+    self.buildTar("other=d/b", "d=d")
+    self.assertTarFileData([("./d/b", "other")])
+
+
+if __name__ == "__main__":
+  unittest.main()